@@ -4,14 +4,11 @@
 import logging
 import endpoints
 from protorpc import remote, messages
-from google.appengine.api import memcache
-from google.appengine.api import taskqueue
-from google.appengine.ext import ndb
 
-from models import User, Game, Level, Word
 from models import StringMessage, NewGameForm, GameForm, MakeMoveForm, \
     ScoreForms, GameForms, RankForms, GameHistoryForm
-from utils import get_by_urlsafe
+from service import HangmanService
+from utils import BadRequestError, NotFoundError
 
 NEW_GAME_REQUEST = endpoints.ResourceContainer(NewGameForm)
 GAME_REQUEST = endpoints.ResourceContainer(
@@ -31,11 +28,17 @@ class HangmanApi(remote.Service):
     """API for a hangman game."""
 
     def __init__(self):
-        # initialize word bank
-        key = Word.query().get(keys_only=True)
-        if key is None:
-            # import word bank from file
-            Word.import_words()
+        self.service = HangmanService()
+
+    def _call(self, method, request):
+        """Call a HangmanService method, raising the Endpoints exception
+        matching any service error."""
+        try:
+            return method(request)
+        except BadRequestError as e:
+            raise endpoints.BadRequestException(str(e))
+        except NotFoundError as e:
+            raise endpoints.NotFoundException(str(e))
 
     @endpoints.method(request_message=NEW_GAME_REQUEST,
                       response_message=GameForm,
@@ -47,24 +50,7 @@ class HangmanApi(remote.Service):
             Create a new user, if it doesnt already exist.
             Return the game state.
         """
-        if request.failed_attempts_allowed not in range(1, 10):
-            raise endpoints.BadRequestException('Attempts allowed must be '
-                                                'between 1 and 10!')
-
-        user = User.query(User.name == request.user_name).get()
-        if not user:
-            # create new user
-            user = User(name=request.user_name,
-                        email=request.email,
-                        total_score=0,
-                        total_played=0)
-            user_key = user.put()
-        else:
-            user_key = user.key
-
-        game = Game.new_game(user_key, request.failed_attempts_allowed)
-
-        return game.to_form('Make your move, {0}!'.format(user.name))
+        return self._call(self.service.new_game, request)
 
     @endpoints.method(request_message=GAME_REQUEST,
                       response_message=GameForm,
@@ -73,20 +59,7 @@ class HangmanApi(remote.Service):
                       http_method='GET')
     def get_game(self, request):
         """Return the specified game state."""
-        game = get_by_urlsafe(request.urlsafe_game_key, Game)
-        if game:
-            if game.game_over:
-                msg = "You scored {0}.".format(game.score)
-            else:
-                level = game.current_level.get()
-                if level.complete:
-                    msg = "Level complete."
-                else:
-                    msg = "Make your move, {0}!".format(game.user.get().name)
-
-            return game.to_form(msg)
-        else:
-            raise endpoints.NotFoundException('Game not found!')
+        return self._call(self.service.get_game, request)
 
     @endpoints.method(request_message=MAKE_MOVE_REQUEST,
                       response_message=GameForm,
@@ -97,42 +70,7 @@ class HangmanApi(remote.Service):
         """Make a move in a game.
             Guess a letter of the word, or the whole word.
             Return the game state."""
-        if not request.guess.isalpha():
-            raise endpoints.BadRequestException('Guess should be at least 1 '
-                                                'letter!')
-
-        game = get_by_urlsafe(request.urlsafe_game_key, Game)
-        if game.game_over:
-            return game.to_form('Game already over!')
-
-        level = game.current_level.get()
-        if level.complete:
-            return game.to_form('Level already complete, get the next level!')
-
-        word = level.word.get()
-        if len(request.guess) != len(word.name) and len(request.guess) != 1:
-            raise endpoints.BadRequestException('Guess 1 letter or the whole '
-                                                'word!')
-
-        if request.guess in level.guesses:
-            raise endpoints.BadRequestException('You already made this guess!')
-
-        game.update_game(request.guess)
-
-        if game.game_over:
-            return game.to_form('Game Over! You scored {0}.'
-                                .format(game.score))
-
-        level = game.current_level.get()
-        if level.complete:
-            return game.to_form('Level complete, get the next level.')
-
-        if request.guess in word.name:
-            msg = "You chose well!"
-        else:
-            msg = "You chose poorly!"
-
-        return game.to_form(msg)
+        return self._call(self.service.make_move, request)
 
     @endpoints.method(request_message=GAME_REQUEST,
                       response_message=GameForm,
@@ -141,17 +79,7 @@ class HangmanApi(remote.Service):
                       http_method='PUT')
     def next_level(self, request):
         """Get the next word in a game. Return the game state."""
-        game = get_by_urlsafe(request.urlsafe_game_key, Game)
-        if game.game_over:
-            return game.to_form('Game already over!')
-        if not game.current_level.get().complete:
-            return game.to_form('Current level is not complete!')
-
-        # create a new level with a new word
-        game.new_level()
-
-        return game.to_form('Make your move, {0}!'
-                            .format(game.user.get().name))
+        return self._call(self.service.next_level, request)
 
     @endpoints.method(request_message=GAME_REQUEST,
                       response_message=StringMessage,
@@ -160,16 +88,7 @@ class HangmanApi(remote.Service):
                       http_method='DELETE')
     def cancel_game(self, request):
         """Delete the specified game."""
-        game = get_by_urlsafe(request.urlsafe_game_key, Game)
-        if game.game_over:
-            return game.to_form('Game completed. Cannot delete.')
-
-        # delete any levels
-        level_keys = Level.query(Level.game == game.key).fetch(keys_only=True)
-        ndb.delete_multi(level_keys)
-
-        game.key.delete()
-        return StringMessage(message='Game deleted.')
+        return self._call(self.service.cancel_game, request)
 
     @endpoints.method(request_message=HIGH_SCORES_REQUEST,
                       response_message=ScoreForms,
@@ -179,13 +98,7 @@ class HangmanApi(remote.Service):
     def get_high_scores(self, request):
         """ Return top scores.
             If number_of_reults parameter is omitted, return top 10."""
-        result_count = 10
-        if request.number_of_results is not None:
-            result_count = request.number_of_results
-        return ScoreForms(items=[
-            game.to_score_form() for game in Game
-            .query(Game.game_over == True)
-            .order(-Game.score).fetch(result_count)])
+        return self._call(self.service.get_high_scores, request)
 
     @endpoints.method(request_message=USER_REQUEST,
                       response_message=GameForms,
@@ -194,12 +107,7 @@ class HangmanApi(remote.Service):
                       http_method='GET')
     def get_user_games(self, request):
         """Return all of an individual User's active games."""
-        user = User.query(User.name == request.user_name).get()
-        if not user:
-            raise endpoints.NotFoundException(
-                    'A User with that name does not exist!')
-        games = Game.query(Game.user == user.key, Game.game_over == False)
-        return GameForms(items=[game.to_form() for game in games])
+        return self._call(self.service.get_user_games, request)
 
     @endpoints.method(request_message=USER_REQUEST,
                       response_message=GameForms,
@@ -208,12 +116,7 @@ class HangmanApi(remote.Service):
                       http_method='GET')
     def get_user_games_completed(self, request):
         """Return all of an individual User's completed games."""
-        user = User.query(User.name == request.user_name).get()
-        if not user:
-            raise endpoints.NotFoundException(
-                    'A User with that name does not exist!')
-        games = Game.query(Game.user == user.key, Game.game_over == True)
-        return GameForms(items=[game.to_form() for game in games])
+        return self._call(self.service.get_user_games_completed, request)
 
     @endpoints.method(response_message=RankForms,
                       path='user/rankings',
@@ -221,8 +124,7 @@ class HangmanApi(remote.Service):
                       http_method='GET')
     def get_user_rankings(self, request):
         """Return all user rankings."""
-        users = User.query().order(-User.average_score)
-        return RankForms(items=[user.to_rank_form() for user in users])
+        return self._call(self.service.get_user_rankings, request)
 
     @endpoints.method(request_message=GAME_REQUEST,
                       response_message=GameHistoryForm,
@@ -231,11 +133,7 @@ class HangmanApi(remote.Service):
                       http_method='GET')
     def get_game_history(self, request):
         """Return the history of the specified game."""
-        game = get_by_urlsafe(request.urlsafe_game_key, Game)
-        if game:
-            return game.to_history_form()
-        else:
-            raise endpoints.NotFoundException('Game not found!')
+        return self._call(self.service.get_game_history, request)
 
 
 api = endpoints.api_server([HangmanApi])
@@ -1,11 +1,31 @@
 """Class definitions for the Datastore entities used by the Hangman API."""
 
+import math
 import random
+import threading
+import time
 from datetime import date
 from protorpc import messages
-from google.appengine.ext import ndb
+from storage import ndb
+from utils import AliasTable
 import json
 
+# Seconds before the in-memory word table is reloaded, to pick up word
+# statistics updated by other instances
+WORD_TABLE_TTL = 300
+# Width of the difficulty band targeted by weighted word selection
+DIFFICULTY_BAND = 0.15
+# Smallest selection weight of a word, however far it is from the target
+MIN_WORD_WEIGHT = 1e-6
+# Change in a word's difficulty that makes the alias tables stale
+DIFFICULTY_TOLERANCE = 0.05
+# Target word difficulty of the first level, and the increase per level
+LEVEL_DIFFICULTY_START = 0.3
+LEVEL_DIFFICULTY_STEP = 0.05
+# Number of weighted draws made when looking for an unplayed word, before
+# falling back to drawing from the unplayed words
+MAX_WEIGHTED_ATTEMPTS = 10
+
 
 class User(ndb.Model):
     """User model
@@ -183,22 +203,35 @@ class Level(ndb.Model):
 
         level_number = Level.query(Level.game == game.key).count() + 1
 
+        # words get harder as the game goes on
+        difficulty = min(LEVEL_DIFFICULTY_START +
+                         LEVEL_DIFFICULTY_STEP * (level_number - 1), 1.0)
+
         # try to get a word that has not been played by the user,
         # if there are any unplayed words left
-        word_key = Word.get_random_word()
-        used_word_keys = []
+        word_key = Word.get_random_word(difficulty)
+        used_word_keys = set()
         user_game_keys = Game.query(Game.user == game.user) \
             .fetch(keys_only=True)
         for user_game_key in user_game_keys:
-            user_level_keys = Level.query(Level.game == user_game_key) \
-                                            .fetch(keys_only=True)
-            for user_level_key in user_level_keys:
-                used_word_keys.append(user_level_key.get().word)
-
-        word_count = Word.query().count()
-        if len(used_word_keys) < word_count:
-            while word_key in used_word_keys:
-                word_key = Word.get_random_word()
+            user_levels = Level.query(Level.game == user_game_key).fetch()
+            for user_level in user_levels:
+                used_word_keys.add(user_level.word)
+
+        # the words are counted from the table the words are drawn from,
+        # so the draws below always end
+        unused_word_keys = set(Word.get_word_keys()) - used_word_keys
+        if unused_word_keys:
+            attempts = 1
+            while word_key not in unused_word_keys:
+                # unplayed words far from the target difficulty are
+                # unlikely to be drawn, so give up on the target after a
+                # few attempts
+                if attempts < MAX_WEIGHTED_ATTEMPTS:
+                    word_key = Word.get_random_word(difficulty)
+                else:
+                    word_key = random.choice(list(unused_word_keys))
+                attempts += 1
 
         level = Level(game=game_key,
                       word=word_key,
@@ -242,6 +275,9 @@ class Level(ndb.Model):
 
         self.put()
 
+        if self.complete:
+            word.update_stats(self.guesses, self.won)
+
 
 class Word(ndb.Model):
     """Word bank model
@@ -249,25 +285,93 @@ class Word(ndb.Model):
     Attributes:
         name: The word to be guessed
         clue: A clue for the word to be guessed
+        times_played: Number of completed levels played with the word
+        times_won: Number of those levels won
+        total_guesses: Total number of guesses made in those levels
+        total_failed_attempts: Total number of failed guesses made in
+            those levels
     """
     name = ndb.StringProperty(required=True)
     clue = ndb.StringProperty(required=True)
+    times_played = ndb.IntegerProperty(default=0, indexed=False)
+    times_won = ndb.IntegerProperty(default=0, indexed=False)
+    total_guesses = ndb.IntegerProperty(default=0, indexed=False)
+    total_failed_attempts = ndb.IntegerProperty(default=0, indexed=False)
 
     @staticmethod
-    def get_random_word():
-        """Return the key of a randomly selected word from word bank."""
-        keys = Word.query().fetch(keys_only=True)
-        return random.sample(keys, 1)[0]
+    def get_random_word(difficulty=None, band=DIFFICULTY_BAND):
+        """Return the key of a randomly selected word from word bank.
+        Args:
+            difficulty: Optional target difficulty between 0 and 1. Words
+                with a difficulty within the band around the target are
+                most likely to be selected. If omitted, all words are
+                equally likely.
+            band: Width of the difficulty band, greater than 0
+        Returns:
+            Word entity key
+        Raises:
+            ValueError: if band is not greater than 0
+        """
+        return _word_table.random_key(difficulty, band)
+
+    @staticmethod
+    def get_word_keys():
+        """Return the keys of the words in the word bank, from the same
+        cached table that random words are selected from.
+        Returns:
+            List of Word entity keys
+        """
+        return _word_table.keys()
+
+    @property
+    def difficulty(self):
+        """Word difficulty between 0 (easy) and 1 (hard), the average of
+        the loss rate and the failed guess rate. Both rates start at 0.5
+        and move towards the observed rates as the word is played."""
+        loss_rate = (self.times_played - self.times_won + 1.0) / \
+            (self.times_played + 2.0)
+        failed_rate = (self.total_failed_attempts + 1.0) / \
+            (self.total_guesses + 2.0)
+        return (loss_rate + failed_rate) / 2
+
+    def update_stats(self, guesses, won):
+        """Add a completed level to the word statistics.
+        The stored word is re-read and updated in a transaction, so levels
+        completed at the same time by other players are not lost.
+        Args:
+            guesses: List of guesses made in the level
+            won: True if the word was guessed
+        Returns:
+            Word object with the updated statistics
+        """
+        word = Word._add_level_stats(self.key, guesses, won)
+        _word_table.update(word)
+        return word
+
+    @staticmethod
+    @ndb.transactional
+    def _add_level_stats(word_key, guesses, won):
+        word = word_key.get()
+        word.times_played += 1
+        if won:
+            word.times_won += 1
+        word.total_guesses += len(guesses)
+        # a failed word guess is not contained in the word either
+        word.total_failed_attempts += len([guess for guess in guesses
+                                           if guess not in word.name])
+        word.put()
+        return word
 
     @staticmethod
     def import_words():
         """Import words from json file."""
         with open("words.json") as json_file:
             json_data = json.load(json_file)
-            for imported_word in json_data:
-                word = Word(name=imported_word["name"],
-                            clue=imported_word["clue"])
-                word.put()
+            words = [Word(name=imported_word["name"],
+                          clue=imported_word["clue"])
+                     for imported_word in json_data]
+            ndb.put_multi(words)
+        _word_table.invalidate()
 
     def get_guessed_word(self, guesses):
         """ Return the word to be guessed, with guessed letters inserted,
@@ -289,6 +393,94 @@ class Word(ndb.Model):
         return ''.join(guessed_word)
 
 
+class WordTable(object):
+    """In-memory table of word keys and difficulties, for selecting words
+    without querying the word bank.
+
+    The table is loaded lazily and reloaded after WORD_TABLE_TTL seconds.
+    Words updated by this instance are updated in place. Alias tables for
+    weighted selection are built lazily for each target difficulty, and
+    discarded on reload, or when a word's difficulty has moved more than
+    DIFFICULTY_TOLERANCE from the difficulty the tables were built with.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loaded_at = None
+        self._keys = []
+        self._positions = {}
+        self._difficulties = []
+        self._alias_tables = {}
+        self._alias_difficulties = []
+
+    def invalidate(self):
+        """Reload the table on next use."""
+        self._loaded_at = None
+
+    def _refresh(self):
+        if self._loaded_at is None or \
+                time.time() - self._loaded_at >= WORD_TABLE_TTL:
+            self._load()
+
+    def _load(self):
+        with self._lock:
+            if self._loaded_at is not None and \
+                    time.time() - self._loaded_at < WORD_TABLE_TTL:
+                return
+            words = Word.query().fetch()
+            self._keys = [word.key for word in words]
+            self._positions = dict((word.key, i)
+                                   for i, word in enumerate(words))
+            self._difficulties = [word.difficulty for word in words]
+            self._clear_alias_tables()
+            self._loaded_at = time.time()
+
+    def _clear_alias_tables(self):
+        self._alias_tables = {}
+        self._alias_difficulties = list(self._difficulties)
+
+    def update(self, word):
+        """Update the difficulty of a word in the table."""
+        with self._lock:
+            i = self._positions.get(word.key)
+            if i is None:
+                return
+            self._difficulties[i] = word.difficulty
+            if abs(word.difficulty - self._alias_difficulties[i]) > \
+                    DIFFICULTY_TOLERANCE:
+                self._clear_alias_tables()
+
+    def keys(self):
+        """Return the keys of the words in the table."""
+        self._refresh()
+        return list(self._keys)
+
+    def random_key(self, difficulty=None, band=DIFFICULTY_BAND):
+        """Return the key of a randomly selected word, weighted towards
+        words within the difficulty band, if a difficulty is given."""
+        if band <= 0:
+            raise ValueError('Difficulty band must be greater than 0')
+        self._refresh()
+        if difficulty is None:
+            return random.choice(self._keys)
+
+        # round the target so similar targets share an alias table
+        target = (round(difficulty, 2), band)
+        with self._lock:
+            alias_table = self._alias_tables.get(target)
+            if alias_table is None:
+                weights = []
+                for d in self._alias_difficulties:
+                    weight = math.exp(-0.5 * ((d - target[0]) / band) ** 2)
+                    weights.append(max(weight, MIN_WORD_WEIGHT))
+                alias_table = AliasTable(self._keys, weights)
+                self._alias_tables[target] = alias_table
+        return alias_table.sample()
+
+
+_word_table = WordTable()
+
+
 class GameForm(messages.Message):
     """GameForm for outbound game state information."""
     urlsafe_key = messages.StringField(1, required=True)
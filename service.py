@@ -0,0 +1,177 @@
+"""service.py - The Hangman API operations, independent of Cloud Endpoints.
+
+HangmanService implements each API method as a plain function from a
+protorpc request message to a response message, raising a ServiceError for
+invalid requests. api.py exposes it as the Cloud Endpoints API on App Engine,
+and wsgi.py serves it from a plain WSGI process.
+"""
+
+from storage import ndb
+
+from models import User, Game, Level, Word
+from models import StringMessage, ScoreForms, GameForms, RankForms
+from utils import get_by_urlsafe, BadRequestError, NotFoundError
+
+
+class HangmanService(object):
+    """Operations of the hangman game API."""
+
+    def __init__(self):
+        # initialize word bank
+        key = Word.query().get(keys_only=True)
+        if key is None:
+            # import word bank from file
+            Word.import_words()
+
+    def new_game(self, request):
+        """ Create new game.
+            Create a new user, if it doesnt already exist.
+            Return the game state.
+        """
+        if request.failed_attempts_allowed not in range(1, 10):
+            raise BadRequestError('Attempts allowed must be '
+                                  'between 1 and 10!')
+
+        user = User.query(User.name == request.user_name).get()
+        if not user:
+            # create new user
+            user = User(name=request.user_name,
+                        email=request.email,
+                        total_score=0,
+                        total_played=0)
+            user_key = user.put()
+        else:
+            user_key = user.key
+
+        game = Game.new_game(user_key, request.failed_attempts_allowed)
+
+        return game.to_form('Make your move, {0}!'.format(user.name))
+
+    def get_game(self, request):
+        """Return the specified game state."""
+        game = get_by_urlsafe(request.urlsafe_game_key, Game)
+        if game:
+            if game.game_over:
+                msg = "You scored {0}.".format(game.score)
+            else:
+                level = game.current_level.get()
+                if level.complete:
+                    msg = "Level complete."
+                else:
+                    msg = "Make your move, {0}!".format(game.user.get().name)
+
+            return game.to_form(msg)
+        else:
+            raise NotFoundError('Game not found!')
+
+    def make_move(self, request):
+        """Make a move in a game.
+            Guess a letter of the word, or the whole word.
+            Return the game state."""
+        if not request.guess.isalpha():
+            raise BadRequestError('Guess should be at least 1 letter!')
+
+        game = get_by_urlsafe(request.urlsafe_game_key, Game)
+        if not game:
+            raise NotFoundError('Game not found!')
+        if game.game_over:
+            return game.to_form('Game already over!')
+
+        level = game.current_level.get()
+        if level.complete:
+            return game.to_form('Level already complete, get the next level!')
+
+        word = level.word.get()
+        if len(request.guess) != len(word.name) and len(request.guess) != 1:
+            raise BadRequestError('Guess 1 letter or the whole word!')
+
+        if request.guess in level.guesses:
+            raise BadRequestError('You already made this guess!')
+
+        game.update_game(request.guess)
+
+        if game.game_over:
+            return game.to_form('Game Over! You scored {0}.'
+                                .format(game.score))
+
+        level = game.current_level.get()
+        if level.complete:
+            return game.to_form('Level complete, get the next level.')
+
+        if request.guess in word.name:
+            msg = "You chose well!"
+        else:
+            msg = "You chose poorly!"
+
+        return game.to_form(msg)
+
+    def next_level(self, request):
+        """Get the next word in a game. Return the game state."""
+        game = get_by_urlsafe(request.urlsafe_game_key, Game)
+        if not game:
+            raise NotFoundError('Game not found!')
+        if game.game_over:
+            return game.to_form('Game already over!')
+        if not game.current_level.get().complete:
+            return game.to_form('Current level is not complete!')
+
+        # create a new level with a new word
+        game.new_level()
+
+        return game.to_form('Make your move, {0}!'
+                            .format(game.user.get().name))
+
+    def cancel_game(self, request):
+        """Delete the specified game."""
+        game = get_by_urlsafe(request.urlsafe_game_key, Game)
+        if not game:
+            raise NotFoundError('Game not found!')
+        if game.game_over:
+            return game.to_form('Game completed. Cannot delete.')
+
+        # delete any levels
+        level_keys = Level.query(Level.game == game.key).fetch(keys_only=True)
+        ndb.delete_multi(level_keys)
+
+        game.key.delete()
+        return StringMessage(message='Game deleted.')
+
+    def get_high_scores(self, request):
+        """ Return top scores.
+            If number_of_reults parameter is omitted, return top 10."""
+        result_count = 10
+        if request.number_of_results is not None:
+            result_count = request.number_of_results
+        return ScoreForms(items=[
+            game.to_score_form() for game in Game
+            .query(Game.game_over == True)
+            .order(-Game.score).fetch(result_count)])
+
+    def get_user_games(self, request):
+        """Return all of an individual User's active games."""
+        user = User.query(User.name == request.user_name).get()
+        if not user:
+            raise NotFoundError('A User with that name does not exist!')
+        games = Game.query(Game.user == user.key, Game.game_over == False)
+        return GameForms(items=[game.to_form() for game in games])
+
+    def get_user_games_completed(self, request):
+        """Return all of an individual User's completed games."""
+        user = User.query(User.name == request.user_name).get()
+        if not user:
+            raise NotFoundError('A User with that name does not exist!')
+        games = Game.query(Game.user == user.key, Game.game_over == True)
+        return GameForms(items=[game.to_form() for game in games])
+
+    def get_user_rankings(self, request):
+        """Return all user rankings."""
+        users = User.query().order(-User.average_score)
+        return RankForms(items=[user.to_rank_form() for user in users])
+
+    def get_game_history(self, request):
+        """Return the history of the specified game."""
+        game = get_by_urlsafe(request.urlsafe_game_key, Game)
+        if game:
+            return game.to_history_form()
+        else:
+            raise NotFoundError('Game not found!')
@@ -0,0 +1,761 @@
+"""sqlite_ndb.py - A SQLite storage backend exposing the subset of the
+google.appengine.ext.ndb interface used by the Hangman models.
+
+Each Model subclass is stored in its own table, with one column per property.
+Every indexed property gets a single column index, like the Datastore's
+built-in indexes, and the composite indexes declared in index.yaml are
+created as multi-column indexes.
+
+Connections are handed out by a thread safe pool, and all SQL is built from
+a fixed set of templates with bound parameters, so statements are compiled
+once per connection and reused from sqlite3's statement cache.
+"""
+
+import base64
+import functools
+import json
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+try:
+    string_types = basestring
+    integer_types = (int, long)
+except NameError:
+    string_types = str
+    integer_types = (int,)
+
+DATABASE_PATH = os.environ.get('HANGMAN_SQLITE_PATH', 'hangman.db')
+POOL_SIZE = int(os.environ.get('HANGMAN_SQLITE_POOL_SIZE', 8))
+INDEX_YAML = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          'index.yaml')
+
+# Registry of model classes by kind, used to resolve keys to entities
+_kinds = {}
+
+
+class BadValueError(Exception):
+    """Raised when a property value is missing or of the wrong type."""
+
+
+class KindError(Exception):
+    """Raised when a key refers to an unknown kind."""
+
+
+class ConnectionPool(object):
+    """A fixed size pool of SQLite connections.
+
+    Connections are created lazily, up to the pool size, and shared between
+    threads one at a time. The database is opened in WAL mode so readers do
+    not block the writer. While a thread has a transaction open, its reads
+    and writes use the transaction's connection.
+    """
+
+    def __init__(self, path, size=POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30,
+                               check_same_thread=False,
+                               isolation_level=None,
+                               cached_statements=256)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                create = True
+            else:
+                create = False
+        if create:
+            try:
+                return self._connect()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        return self._idle.get()
+
+    @contextmanager
+    def connection(self):
+        """Check out a connection for the duration of a with block."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            yield conn
+            return
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            self._idle.put(conn)
+
+    @contextmanager
+    def transaction(self):
+        """Check out a connection and run the with block in a transaction.
+        A transaction opened inside another one on the same thread joins
+        the outer transaction."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            yield conn
+            return
+        conn = self._acquire()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+        except Exception:
+            self._idle.put(conn)
+            raise
+        self._local.conn = conn
+        try:
+            yield conn
+            conn.execute('COMMIT')
+        except Exception:
+            try:
+                conn.execute('ROLLBACK')
+            except sqlite3.Error:
+                # the transaction state is unknown, replace the connection
+                self._discard(conn)
+                conn = None
+            raise
+        finally:
+            self._local.conn = None
+            if conn is not None:
+                self._idle.put(conn)
+
+    def _discard(self, conn):
+        conn.close()
+        with self._lock:
+            self._created -= 1
+
+    def close(self):
+        """Close all idle connections."""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_schema_lock = threading.Lock()
+_schema_ready = set()
+_composite_indexes = None
+
+
+def get_pool():
+    """Return the process wide connection pool, creating it if needed."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(DATABASE_PATH)
+    return _pool
+
+
+def configure(path, pool_size=POOL_SIZE):
+    """Point the backend at a different database file.
+
+    Args:
+        path: SQLite database file path, or ':memory:' for a private,
+            single connection in-memory database.
+        pool_size: Maximum number of pooled connections
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+        if path == ':memory:':
+            # every in-memory connection is a separate database
+            pool_size = 1
+        _pool = ConnectionPool(path, pool_size)
+        _schema_ready.clear()
+
+
+def _load_composite_indexes():
+    """Return the composite indexes declared in index.yaml, by kind.
+
+    Each index is a list of (property name, descending) tuples. index.yaml
+    only uses a fixed set of keys, so it is parsed line by line rather than
+    with a YAML library.
+    """
+    try:
+        with open(INDEX_YAML) as yaml_file:
+            lines = yaml_file.readlines()
+    except IOError:
+        logging.warning('%s not found, skipping composite indexes',
+                        INDEX_YAML)
+        return {}
+
+    indexes = {}
+    properties = None
+    for line in lines:
+        line = line.split('#', 1)[0].strip()
+        if line.startswith('- '):
+            line = line[2:].strip()
+        if ':' not in line:
+            continue
+        key, value = [part.strip() for part in line.split(':', 1)]
+        if key == 'kind':
+            properties = []
+            indexes.setdefault(value, []).append(properties)
+        elif key == 'name' and properties is not None:
+            properties.append((value, False))
+        elif key == 'direction' and properties:
+            properties[-1] = (properties[-1][0], value == 'desc')
+    return indexes
+
+
+def _ensure_schema(model_class):
+    """Create the table and indexes for a model, once per pool.
+
+    Called before a connection is checked out for a query or write. The
+    schema is updated in a write transaction, so threads and processes
+    opening the same database do not race to add the same columns.
+    """
+    kind = model_class._get_kind()
+    if kind in _schema_ready:
+        return
+    with _schema_lock:
+        if kind in _schema_ready:
+            return
+        with get_pool().transaction() as conn:
+            _create_schema(model_class, conn)
+        _schema_ready.add(kind)
+
+
+def _create_schema(model_class, conn):
+    kind = model_class._get_kind()
+    columns = ['id INTEGER PRIMARY KEY AUTOINCREMENT']
+    columns += ['"{0}" {1}'.format(name, prop._sql_type)
+                for name, prop in model_class._properties.items()]
+    conn.execute('CREATE TABLE IF NOT EXISTS "{0}" ({1})'
+                 .format(kind, ', '.join(columns)))
+
+    # add columns for properties added to the model since the table was
+    # created, rows written before then read back the property default
+    existing = set(row[1] for row in
+                   conn.execute('PRAGMA table_info("{0}")'.format(kind)))
+    for name, prop in model_class._properties.items():
+        if name not in existing:
+            conn.execute('ALTER TABLE "{0}" ADD COLUMN "{1}" {2}'
+                         .format(kind, name, prop._sql_type))
+
+    for name, prop in model_class._properties.items():
+        if prop._indexed and not prop._repeated:
+            conn.execute('CREATE INDEX IF NOT EXISTS "{0}_{1}" '
+                         'ON "{0}" ("{1}")'.format(kind, name))
+
+    global _composite_indexes
+    if _composite_indexes is None:
+        _composite_indexes = _load_composite_indexes()
+    for properties in _composite_indexes.get(kind, []):
+        index_name = '_'.join([kind] + [name for name, _ in properties])
+        index_columns = ', '.join(
+            '"{0}"{1}'.format(name, ' DESC' if desc else '')
+            for name, desc in properties)
+        conn.execute('CREATE INDEX IF NOT EXISTS "{0}" ON "{1}" ({2})'
+                     .format(index_name, kind, index_columns))
+
+
+class Key(object):
+    """Entity key, a kind and an integer id."""
+
+    def __init__(self, *args, **kwargs):
+        urlsafe = kwargs.pop('urlsafe', None)
+        if urlsafe is not None:
+            args = self._decode(urlsafe)
+        if len(args) != 2:
+            raise TypeError('Key requires a kind and an id')
+        kind, id = args
+        if isinstance(kind, type):
+            kind = kind._get_kind()
+        self._kind = kind
+        self._id = int(id)
+
+    @staticmethod
+    def _decode(urlsafe):
+        try:
+            if not isinstance(urlsafe, bytes):
+                urlsafe = urlsafe.encode('ascii')
+            padding = b'=' * (-len(urlsafe) % 4)
+            kind, id = base64.urlsafe_b64decode(urlsafe + padding) \
+                .decode('ascii').split(':', 1)
+            return kind, int(id)
+        except (ValueError, UnicodeError, TypeError):
+            raise TypeError('Invalid key')
+
+    def kind(self):
+        return self._kind
+
+    def id(self):
+        return self._id
+
+    def urlsafe(self):
+        """Return a url safe string representation of the key."""
+        raw = '{0}:{1}'.format(self._kind, self._id).encode('ascii')
+        return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+    def get(self):
+        """Return the entity the key points to, or None."""
+        return get_multi([self])[0]
+
+    def delete(self):
+        """Delete the entity the key points to."""
+        delete_multi([self])
+
+    def __eq__(self, other):
+        return (isinstance(other, Key) and
+                (self._kind, self._id) == (other._kind, other._id))
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((self._kind, self._id))
+
+    def __repr__(self):
+        return 'Key({0!r}, {1!r})'.format(self._kind, self._id)
+
+
+class FilterNode(object):
+    """A single property comparison in a query."""
+
+    def __init__(self, name, op, value):
+        self.name = name
+        self.op = op
+        self.value = value
+
+
+class Property(object):
+    """Base property, stores a value in a column of the model's table."""
+
+    _sql_type = 'TEXT'
+
+    def __init__(self, required=False, default=None, repeated=False,
+                 indexed=True):
+        self._name = None
+        self._required = required
+        self._default = default
+        self._repeated = repeated
+        self._indexed = indexed
+
+    def _validate(self, value):
+        return value
+
+    def _to_db(self, value):
+        return value
+
+    def _from_db(self, value):
+        return value
+
+    def _db_value(self, value):
+        if self._repeated:
+            return json.dumps([self._to_db(v) for v in value])
+        if value is None:
+            return None
+        return self._to_db(value)
+
+    def _python_value(self, value):
+        if self._repeated:
+            return [self._from_db(v) for v in json.loads(value or '[]')]
+        if value is None:
+            return self._default
+        return self._from_db(value)
+
+    def __get__(self, entity, owner):
+        if entity is None:
+            return self
+        if self._name not in entity._values:
+            entity._values[self._name] = [] if self._repeated \
+                else self._default
+        return entity._values[self._name]
+
+    def __set__(self, entity, value):
+        if self._repeated:
+            value = [self._validate(v) for v in (value or [])]
+        elif value is not None:
+            value = self._validate(value)
+        entity._values[self._name] = value
+
+    def _comparison(self, op, value):
+        if value is not None:
+            value = self._db_value(self._validate(value))
+        return FilterNode(self._name, op, value)
+
+    def __eq__(self, value):
+        return self._comparison('=', value)
+
+    def __ne__(self, value):
+        return self._comparison('!=', value)
+
+    def __lt__(self, value):
+        return self._comparison('<', value)
+
+    def __le__(self, value):
+        return self._comparison('<=', value)
+
+    def __gt__(self, value):
+        return self._comparison('>', value)
+
+    def __ge__(self, value):
+        return self._comparison('>=', value)
+
+    def __neg__(self):
+        return (self._name, True)
+
+    def __hash__(self):
+        return id(self)
+
+
+class StringProperty(Property):
+    _sql_type = 'TEXT'
+
+    def _validate(self, value):
+        if not isinstance(value, string_types):
+            raise BadValueError('Expected string, got {0!r}'.format(value))
+        return value
+
+
+class IntegerProperty(Property):
+    _sql_type = 'INTEGER'
+
+    def _validate(self, value):
+        if isinstance(value, bool) or not isinstance(value, integer_types):
+            raise BadValueError('Expected integer, got {0!r}'.format(value))
+        return int(value)
+
+
+class BooleanProperty(Property):
+    _sql_type = 'INTEGER'
+
+    def _validate(self, value):
+        if not isinstance(value, bool):
+            raise BadValueError('Expected bool, got {0!r}'.format(value))
+        return value
+
+    def _to_db(self, value):
+        return int(value)
+
+    def _from_db(self, value):
+        return bool(value)
+
+
+class DateProperty(Property):
+    _sql_type = 'TEXT'
+
+    def _validate(self, value):
+        if isinstance(value, datetime) or not isinstance(value, date):
+            raise BadValueError('Expected date, got {0!r}'.format(value))
+        return value
+
+    def _to_db(self, value):
+        return value.isoformat()
+
+    def _from_db(self, value):
+        return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+class KeyProperty(Property):
+    """Key of another entity, stored as the integer id of a fixed kind."""
+
+    _sql_type = 'INTEGER'
+
+    def __init__(self, kind=None, **kwargs):
+        super(KeyProperty, self).__init__(**kwargs)
+        self._kind = kind
+
+    def _validate(self, value):
+        if not isinstance(value, Key):
+            raise BadValueError('Expected Key, got {0!r}'.format(value))
+        if self._kind and value.kind() != self._kind:
+            raise BadValueError('Expected Key of kind {0}, got {1!r}'
+                                .format(self._kind, value))
+        return value
+
+    def _to_db(self, value):
+        return value.id()
+
+    def _from_db(self, value):
+        return Key(self._kind, value)
+
+
+class MetaModel(type):
+    """Collects the properties of a model class and registers its kind."""
+
+    def __init__(cls, name, bases, classdict):
+        super(MetaModel, cls).__init__(name, bases, classdict)
+        cls._properties = {}
+        for base in reversed(cls.__mro__):
+            for attr, value in vars(base).items():
+                if isinstance(value, Property):
+                    value._name = attr
+                    cls._properties[attr] = value
+        if not name.startswith('_') and name != 'Model':
+            _kinds[name] = cls
+
+
+_BaseModel = MetaModel('_BaseModel', (object,), {})
+
+
+class Model(_BaseModel):
+    """Base class for entities stored in SQLite."""
+
+    def __init__(self, key=None, **kwargs):
+        self._values = {}
+        self.key = key
+        for name, value in kwargs.items():
+            if name not in self._properties:
+                raise TypeError('{0} has no property {1}'
+                                .format(self._get_kind(), name))
+            setattr(self, name, value)
+
+    @classmethod
+    def _get_kind(cls):
+        return cls.__name__
+
+    @classmethod
+    def query(cls, *filters):
+        """Return a Query for entities of this kind."""
+        return Query(cls, filters)
+
+    @classmethod
+    def get_by_id(cls, id):
+        return Key(cls, id).get()
+
+    def _row(self):
+        row = []
+        for name, prop in self._properties.items():
+            value = getattr(self, name)
+            if prop._required and value is None:
+                raise BadValueError('Entity has uninitialized properties: {0}'
+                                    .format(name))
+            row.append(prop._db_value(value))
+        return row
+
+    @classmethod
+    def _from_row(cls, row):
+        entity = cls(key=Key(cls, row[0]))
+        for (name, prop), value in zip(cls._properties.items(), row[1:]):
+            entity._values[name] = prop._python_value(value)
+        return entity
+
+    def put(self):
+        """Write the entity, returning its key."""
+        return put_multi([self])[0]
+
+    def __repr__(self):
+        return '{0}(key={1!r}, {2})'.format(
+            self._get_kind(), self.key,
+            ', '.join('{0}={1!r}'.format(n, getattr(self, n))
+                      for n in self._properties))
+
+
+class Query(object):
+    """A query over a single kind, with equality and inequality filters and
+    sort orders, as used by the Hangman models."""
+
+    def __init__(self, model_class, filters=(), orders=()):
+        self._model_class = model_class
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+
+    def filter(self, *filters):
+        return Query(self._model_class, self._filters + filters,
+                     self._orders)
+
+    def order(self, *orders):
+        orders = tuple(o if isinstance(o, tuple) else (o._name, False)
+                       for o in orders)
+        return Query(self._model_class, self._filters,
+                     self._orders + orders)
+
+    def _where(self):
+        clauses = []
+        params = []
+        for node in self._filters:
+            if node.value is None:
+                clauses.append('"{0}" IS {1}NULL'.format(
+                    node.name, 'NOT ' if node.op == '!=' else ''))
+            elif node.op == '!=':
+                clauses.append('"{0}" <> ?'.format(node.name))
+                params.append(node.value)
+            else:
+                clauses.append('"{0}" {1} ?'.format(node.name, node.op))
+                params.append(node.value)
+        sql = ' WHERE ' + ' AND '.join(clauses) if clauses else ''
+        return sql, params
+
+    def _select(self, columns, limit=None, offset=0):
+        kind = self._model_class._get_kind()
+        where, params = self._where()
+        sql = 'SELECT {0} FROM "{1}"{2}'.format(columns, kind, where)
+        if self._orders:
+            sql += ' ORDER BY ' + ', '.join(
+                '"{0}"{1}'.format(name, ' DESC' if desc else '')
+                for name, desc in self._orders)
+        if limit is not None or offset:
+            sql += ' LIMIT ? OFFSET ?'
+            params += [-1 if limit is None else limit, offset]
+        _ensure_schema(self._model_class)
+        with get_pool().connection() as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def fetch(self, limit=None, offset=0, keys_only=False):
+        """Return a list of matching entities, or their keys."""
+        if keys_only:
+            rows = self._select('id', limit, offset)
+            return [Key(self._model_class, row[0]) for row in rows]
+        columns = ', '.join(['id'] + ['"{0}"'.format(name) for name in
+                                      self._model_class._properties])
+        rows = self._select(columns, limit, offset)
+        return [self._model_class._from_row(row) for row in rows]
+
+    def get(self, keys_only=False):
+        """Return the first matching entity, or its key, or None."""
+        results = self.fetch(1, keys_only=keys_only)
+        return results[0] if results else None
+
+    def count(self, limit=None):
+        """Return the number of matching entities."""
+        kind = self._model_class._get_kind()
+        where, params = self._where()
+        sql = 'SELECT COUNT(*) FROM "{0}"{1}'.format(kind, where)
+        if limit is not None:
+            sql = 'SELECT COUNT(*) FROM (SELECT 1 FROM "{0}"{1} LIMIT ?)' \
+                .format(kind, where)
+            params.append(limit)
+        _ensure_schema(self._model_class)
+        with get_pool().connection() as conn:
+            return conn.execute(sql, params).fetchone()[0]
+
+    def __iter__(self):
+        return iter(self.fetch())
+
+
+def _group_by_kind(items, kind_of):
+    groups = {}
+    for item in items:
+        groups.setdefault(kind_of(item), []).append(item)
+    return groups
+
+
+def _model_class(kind):
+    try:
+        model_class = _kinds[kind]
+    except KeyError:
+        raise KindError('No model class found for kind {0}'.format(kind))
+    _ensure_schema(model_class)
+    return model_class
+
+
+def put_multi(entities):
+    """Write a list of entities in a single transaction, returning their
+    keys. Existing entities of the same kind are written with one batched
+    statement, new entities reuse one prepared insert statement."""
+    groups = [(_model_class(kind), group) for kind, group in
+              _group_by_kind(entities, lambda e: e._get_kind()).items()]
+    with get_pool().transaction() as conn:
+        for model_class, group in groups:
+            kind = model_class._get_kind()
+            names = ['"{0}"'.format(n) for n in model_class._properties]
+
+            updates = [e for e in group if e.key is not None]
+            if updates:
+                conn.executemany(
+                    'INSERT OR REPLACE INTO "{0}" (id, {1}) VALUES (?, {2})'
+                    .format(kind, ', '.join(names),
+                            ', '.join('?' * len(names))),
+                    [[e.key.id()] + e._row() for e in updates])
+
+            inserts = [e for e in group if e.key is None]
+            if inserts:
+                sql = 'INSERT INTO "{0}" ({1}) VALUES ({2})'.format(
+                    kind, ', '.join(names), ', '.join('?' * len(names)))
+                for entity in inserts:
+                    cursor = conn.execute(sql, entity._row())
+                    entity.key = Key(kind, cursor.lastrowid)
+    return [e.key for e in entities]
+
+
+def get_multi(keys):
+    """Return the entities for a list of keys, with None for missing ones.
+    Keys of the same kind are fetched with a single query."""
+    found = {}
+    groups = [(_model_class(kind), group) for kind, group in
+              _group_by_kind(keys, lambda k: k.kind()).items()]
+    with get_pool().connection() as conn:
+        for model_class, group in groups:
+            kind = model_class._get_kind()
+            columns = ', '.join(['id'] + ['"{0}"'.format(name) for name in
+                                          model_class._properties])
+            ids = list(set(k.id() for k in group))
+            rows = conn.execute(
+                'SELECT {0} FROM "{1}" WHERE id IN ({2})'.format(
+                    columns, kind, ', '.join('?' * len(ids))), ids)
+            for row in rows:
+                entity = model_class._from_row(row)
+                found[entity.key] = entity
+    return [found.get(key) for key in keys]
+
+
+def delete_multi(keys):
+    """Delete the entities for a list of keys in a single transaction."""
+    groups = [(_model_class(kind), group) for kind, group in
+              _group_by_kind(keys, lambda k: k.kind()).items()]
+    with get_pool().transaction() as conn:
+        for model_class, group in groups:
+            kind = model_class._get_kind()
+            conn.executemany('DELETE FROM "{0}" WHERE id = ?'.format(kind),
+                             [(k.id(),) for k in group])
+
+
+def _ensure_all_schemas():
+    """Create the tables for all models, unless they are already set up.
+
+    A transaction cannot know in advance which kinds the function will
+    use, and a schema update inside it would wait on _schema_lock while
+    holding the database write lock, deadlocking with a thread holding
+    _schema_lock and waiting for the write lock. So every registered kind
+    is set up before the transaction starts.
+    """
+    if len(_schema_ready) >= len(_kinds):
+        return
+    for model_class in list(_kinds.values()):
+        _ensure_schema(model_class)
+
+
+def transactional(func=None, **options):
+    """Decorator running a function in a transaction, like
+    ndb.transactional. The transaction takes the database write lock when
+    it starts, so concurrent read-modify-write updates are serialized.
+    ndb options, such as retries, are accepted and ignored."""
+    if func is None:
+        return lambda f: transactional(f, **options)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        _ensure_all_schemas()
+        with get_pool().transaction():
+            return func(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,16 @@
+"""storage.py - Selects the storage backend used by the Hangman models.
+
+On App Engine the models are stored in the Datastore using ndb. Anywhere
+else, or when the HANGMAN_STORAGE environment variable is set to 'sqlite',
+the ndb compatible SQLite backend in sqlite_ndb.py is used instead.
+"""
+
+import os
+
+if os.environ.get('HANGMAN_STORAGE') == 'sqlite':
+    import sqlite_ndb as ndb
+else:
+    try:
+        from google.appengine.ext import ndb
+    except ImportError:
+        import sqlite_ndb as ndb
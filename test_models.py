@@ -0,0 +1,220 @@
+"""test_models.py - Tests for the word statistics and word selection."""
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+from collections import Counter
+
+import sqlite_ndb
+import models
+from models import Word
+
+
+class WordTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        sqlite_ndb.configure(os.path.join(self.directory, 'test.db'))
+        models._word_table = models.WordTable()
+
+    def tearDown(self):
+        sqlite_ndb.get_pool().close()
+        shutil.rmtree(self.directory)
+
+    def test_difficulty_of_unplayed_word(self):
+        self.assertAlmostEqual(Word(name='cat', clue='pet').difficulty, 0.5)
+
+    def test_difficulty(self):
+        word = Word(name='cat', clue='pet', times_played=8, times_won=6,
+                    total_guesses=18, total_failed_attempts=8)
+        # loss rate (2 + 1) / (8 + 2), failed guess rate (8 + 1) / (18 + 2)
+        self.assertAlmostEqual(word.difficulty, (0.3 + 0.45) / 2)
+
+    def test_update_stats(self):
+        word = Word(name='cat', clue='pet')
+        word.put()
+        word.update_stats(['c', 'x', 'dog', 'a', 't'], True)
+        word = word.update_stats(['z', 'cab'], False)
+
+        stored = word.key.get()
+        self.assertEqual(stored.times_played, 2)
+        self.assertEqual(stored.times_won, 1)
+        self.assertEqual(stored.total_guesses, 7)
+        self.assertEqual(stored.total_failed_attempts, 4)
+        self.assertEqual(word.total_failed_attempts, 4)
+
+    def test_concurrent_update_stats(self):
+        sqlite_ndb.configure(os.path.join(self.directory, 'test.db'), 8)
+        word = Word(name='cat', clue='pet')
+        word.put()
+
+        def play():
+            for _ in range(10):
+                word.update_stats(['c', 'a', 't'], True)
+
+        threads = [threading.Thread(target=play) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(word.key.get().times_played, 80)
+
+    def test_weighted_selection(self):
+        easy = Word(name='cat', clue='pet', times_played=50, times_won=50,
+                    total_guesses=150, total_failed_attempts=0)
+        hard = Word(name='jazz', clue='music', times_played=50, times_won=0,
+                    total_guesses=300, total_failed_attempts=300)
+        sqlite_ndb.put_multi([easy, hard])
+
+        counts = Counter(Word.get_random_word(0.0) for _ in range(1000))
+        self.assertEqual(counts[easy.key], 1000)
+        counts = Counter(Word.get_random_word(1.0) for _ in range(1000))
+        self.assertEqual(counts[hard.key], 1000)
+        counts = Counter(Word.get_random_word() for _ in range(1000))
+        self.assertEqual(set(counts), set([easy.key, hard.key]))
+
+    def test_narrow_band(self):
+        Word(name='cat', clue='pet').put()
+        # every weight is below the floor, so selection is uniform
+        self.assertEqual(Word.get_random_word(0.9, band=0.001).get().name,
+                         'cat')
+        self.assertRaises(ValueError, Word.get_random_word, 0.9, band=0)
+
+    def test_alias_tables_kept_for_small_changes(self):
+        word = Word(name='cat', clue='pet', times_played=50, times_won=25,
+                    total_guesses=200, total_failed_attempts=100)
+        word.put()
+        target = (0.5, models.DIFFICULTY_BAND)
+        Word.get_random_word(0.5)
+        table = models._word_table._alias_tables[target]
+
+        # difficulty moves from 0.5 to about 0.49
+        word.update_stats(['c', 'a', 't'], True)
+        self.assertIs(models._word_table._alias_tables.get(target), table)
+
+        # five lost levels move it to about 0.57
+        for _ in range(5):
+            word.update_stats(list('bdefghijkl'), False)
+        self.assertNotIn(target, models._word_table._alias_tables)
+
+
+class LevelTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        sqlite_ndb.configure(os.path.join(self.directory, 'test.db'))
+        models._word_table = models.WordTable()
+        self.words = [Word(name='cat', clue='pet'),
+                      Word(name='dog', clue='pet')]
+        sqlite_ndb.put_multi(self.words)
+        self.user_key = models.User(name='ann').put()
+
+    def tearDown(self):
+        sqlite_ndb.get_pool().close()
+        shutil.rmtree(self.directory)
+
+    def record_targets(self, word_key=None):
+        """Replace Word.get_random_word with a function recording the
+        target difficulties, and returning the given word key if any."""
+        targets = []
+        get_random_word = Word.get_random_word
+
+        def record(difficulty=None, band=models.DIFFICULTY_BAND):
+            targets.append(difficulty)
+            if word_key is not None:
+                return word_key
+            return get_random_word(difficulty, band)
+
+        Word.get_random_word = staticmethod(record)
+        self.addCleanup(setattr, Word, 'get_random_word',
+                        staticmethod(get_random_word))
+        return targets
+
+    def test_stats_updated_when_level_won(self):
+        game = models.Game.new_game(self.user_key, 6)
+        level = game.current_level.get()
+        word_key = level.word
+        name = word_key.get().name
+
+        level.update_level('x')
+        self.assertEqual(word_key.get().times_played, 0)
+        for guess in name:
+            level.update_level(guess)
+
+        word = word_key.get()
+        self.assertEqual(word.times_played, 1)
+        self.assertEqual(word.times_won, 1)
+        self.assertEqual(word.total_guesses, 4)
+        self.assertEqual(word.total_failed_attempts, 1)
+
+    def test_stats_updated_when_level_lost(self):
+        game = models.Game.new_game(self.user_key, 2)
+        level = game.current_level.get()
+        word_key = level.word
+
+        level.update_level('x')
+        self.assertEqual(word_key.get().times_played, 0)
+        level.update_level('zzz')
+
+        word = word_key.get()
+        self.assertEqual(word.times_played, 1)
+        self.assertEqual(word.times_won, 0)
+        self.assertEqual(word.total_guesses, 2)
+        self.assertEqual(word.total_failed_attempts, 2)
+
+    def test_level_difficulty(self):
+        targets = self.record_targets()
+        game = models.Game.new_game(self.user_key, 6)
+        game.new_level()
+        self.assertEqual(targets[0], models.LEVEL_DIFFICULTY_START)
+        self.assertAlmostEqual(targets[-1], models.LEVEL_DIFFICULTY_START +
+                               models.LEVEL_DIFFICULTY_STEP)
+
+    def test_unplayed_word_after_weighted_attempts(self):
+        game = models.Game.new_game(self.user_key, 6)
+        played = game.current_level.get().word
+        unplayed = [word.key for word in self.words if word.key != played]
+
+        # weighted draws keep returning the played word
+        targets = self.record_targets(played)
+        game.new_level()
+        self.assertEqual(game.current_level.get().word, unplayed[0])
+        self.assertEqual(len(targets), models.MAX_WEIGHTED_ATTEMPTS)
+
+    def test_all_words_played(self):
+        game = models.Game.new_game(self.user_key, 6)
+        game.new_level()
+        # every word has been played, so any word is used
+        game.new_level()
+        self.assertEqual(models.Level.query().count(), 3)
+
+
+class SchemaTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'test.db')
+        sqlite_ndb.configure(self.path)
+
+    def tearDown(self):
+        sqlite_ndb.get_pool().close()
+        shutil.rmtree(self.directory)
+
+    def test_index_yaml_indexes(self):
+        for model in (models.User, models.Game, models.Level):
+            model.query().count()
+        conn = sqlite3.connect(self.path)
+        indexes = dict(conn.execute(
+            'SELECT name, sql FROM sqlite_master WHERE type = \'index\''))
+        conn.close()
+        self.assertIn('"score" DESC', indexes['Game_game_over_score'])
+        self.assertIn('Level_game_level_number', indexes)
+        self.assertIn('"total_score" DESC',
+                      indexes['User_total_score_total_played'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,200 @@
+"""test_sqlite_ndb.py - Tests for the SQLite storage backend."""
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+from datetime import date
+
+import sqlite_ndb as ndb
+
+
+class Player(ndb.Model):
+    name = ndb.StringProperty(required=True)
+    score = ndb.IntegerProperty(default=0)
+    active = ndb.BooleanProperty(default=True)
+    joined = ndb.DateProperty()
+    tags = ndb.StringProperty(repeated=True)
+
+
+class Match(ndb.Model):
+    player = ndb.KeyProperty(required=True, kind='Player')
+    points = ndb.IntegerProperty(default=0)
+
+
+class SqliteTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'test.db')
+        ndb.configure(self.path)
+
+    def tearDown(self):
+        ndb.get_pool().close()
+        shutil.rmtree(self.directory)
+
+
+class ModelTest(SqliteTestCase):
+
+    def test_put_and_get(self):
+        player = Player(name='ann', score=3, joined=date(2016, 1, 2),
+                        tags=['a', 'b'])
+        key = player.put()
+        self.assertEqual(key, player.key)
+
+        loaded = key.get()
+        self.assertEqual(loaded.name, 'ann')
+        self.assertEqual(loaded.score, 3)
+        self.assertEqual(loaded.active, True)
+        self.assertEqual(loaded.joined, date(2016, 1, 2))
+        self.assertEqual(loaded.tags, ['a', 'b'])
+
+        loaded.score = 5
+        loaded.put()
+        self.assertEqual(key.get().score, 5)
+        self.assertEqual(Player.query().count(), 1)
+
+    def test_defaults(self):
+        player = Player(name='ann')
+        self.assertEqual(player.score, 0)
+        self.assertEqual(player.tags, [])
+        self.assertEqual(player.put().get().joined, None)
+
+    def test_required_property(self):
+        self.assertRaises(ndb.BadValueError, Player().put)
+        self.assertRaises(ndb.BadValueError, Player, name=1)
+
+    def test_urlsafe_key(self):
+        key = Player(name='ann').put()
+        self.assertEqual(ndb.Key(urlsafe=key.urlsafe()), key)
+        self.assertRaises(TypeError, ndb.Key, urlsafe='not a key')
+
+    def test_key_property(self):
+        player_key = Player(name='ann').put()
+        match_key = Match(player=player_key, points=2).put()
+        self.assertEqual(match_key.get().player, player_key)
+        self.assertEqual(
+            Match.query(Match.player == player_key).get().key, match_key)
+
+
+class QueryTest(SqliteTestCase):
+
+    def setUp(self):
+        super(QueryTest, self).setUp()
+        self.keys = ndb.put_multi([
+            Player(name='ann', score=3),
+            Player(name='bob', score=7, active=False),
+            Player(name='cat', score=5),
+        ])
+
+    def test_filters(self):
+        self.assertEqual(
+            [p.name for p in Player.query(Player.active == True)
+             .order(Player.name)], ['ann', 'cat'])
+        self.assertEqual(Player.query(Player.score > 4).count(), 2)
+        self.assertEqual(Player.query(Player.joined != None).count(), 0)
+        self.assertEqual(Player.query(Player.name == 'bob').get().score, 7)
+        self.assertEqual(Player.query(Player.name == 'dan').get(), None)
+
+    def test_order_and_limit(self):
+        players = Player.query().order(-Player.score).fetch(2)
+        self.assertEqual([p.name for p in players], ['bob', 'cat'])
+        keys = Player.query().order(Player.score).fetch(keys_only=True)
+        self.assertEqual(keys, [self.keys[0], self.keys[2], self.keys[1]])
+
+    def test_get_multi(self):
+        missing = ndb.Key(Player, 100)
+        players = ndb.get_multi([self.keys[2], missing, self.keys[0]])
+        self.assertEqual(players[0].name, 'cat')
+        self.assertEqual(players[1], None)
+        self.assertEqual(players[2].name, 'ann')
+
+    def test_delete(self):
+        self.keys[0].delete()
+        self.assertEqual(self.keys[0].get(), None)
+        ndb.delete_multi(self.keys[1:])
+        self.assertEqual(Player.query().count(), 0)
+
+
+class SchemaTest(SqliteTestCase):
+
+    def create_old_table(self):
+        conn = sqlite3.connect(self.path)
+        conn.execute('CREATE TABLE "Player" '
+                     '(id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT)')
+        conn.execute('INSERT INTO "Player" (name) VALUES (\'ann\')')
+        conn.commit()
+        conn.close()
+
+    def test_new_properties_added(self):
+        self.create_old_table()
+        player = Player.query().get()
+        self.assertEqual(player.name, 'ann')
+        self.assertEqual(player.score, 0)
+        self.assertEqual(player.tags, [])
+        player.score = 4
+        player.put()
+        self.assertEqual(Player.query(Player.score == 4).count(), 1)
+
+    def test_concurrent_schema_update(self):
+        self.create_old_table()
+        ndb.configure(self.path, 8)
+        errors = []
+
+        def count():
+            try:
+                Player.query().count()
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=count) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_indexes(self):
+        Player.query().count()
+        conn = sqlite3.connect(self.path)
+        indexes = set(row[0] for row in conn.execute(
+            'SELECT name FROM sqlite_master WHERE type = \'index\''))
+        conn.close()
+        self.assertIn('Player_score', indexes)
+        self.assertNotIn('Player_tags', indexes)
+
+    def test_index_yaml(self):
+        indexes = ndb._load_composite_indexes()
+        self.assertEqual(indexes['Game'], [[('game_over', False),
+                                            ('score', True)]])
+        self.assertEqual(indexes['Level'], [[('game', False),
+                                             ('level_number', False)]])
+        self.assertEqual(indexes['User'], [[('total_score', True),
+                                            ('total_played', False)]])
+
+
+class TransactionTest(SqliteTestCase):
+
+    def test_failed_commit_rolled_back(self):
+        ndb.configure(self.path, 1)
+        pool = ndb.get_pool()
+        with pool.connection() as conn:
+            conn.execute('PRAGMA foreign_keys = ON')
+            conn.execute('CREATE TABLE parent (id INTEGER PRIMARY KEY)')
+            conn.execute('CREATE TABLE child (parent_id INTEGER REFERENCES '
+                         'parent (id) DEFERRABLE INITIALLY DEFERRED)')
+
+        def insert_orphan():
+            with pool.transaction() as conn:
+                conn.execute('INSERT INTO child VALUES (1)')
+
+        # the foreign key is checked on commit, which fails
+        self.assertRaises(sqlite3.IntegrityError, insert_orphan)
+        Player(name='ann').put()
+        self.assertEqual(Player.query().count(), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+"""test_utils.py - Tests for the general utility functions."""
+
+import random
+import unittest
+from collections import Counter
+
+from utils import AliasTable
+
+
+def table_probabilities(table):
+    """Return the probability of drawing each item from an AliasTable."""
+    n = len(table.items)
+    probabilities = [p / n for p in table.prob]
+    for i, alias in enumerate(table.alias):
+        probabilities[alias] += (1.0 - table.prob[i]) / n
+    return probabilities
+
+
+class AliasTableTest(unittest.TestCase):
+
+    def test_probabilities(self):
+        weights = [1, 2, 7, 0, 10]
+        table = AliasTable('abcde', weights)
+        for p, w in zip(table_probabilities(table), weights):
+            self.assertAlmostEqual(p, w / 20.0)
+
+    def test_sample_distribution(self):
+        random.seed(1)
+        table = AliasTable('abc', [1, 2, 7])
+        counts = Counter(table.sample() for _ in range(100000))
+        self.assertAlmostEqual(counts['a'] / 100000.0, 0.1, delta=0.01)
+        self.assertAlmostEqual(counts['b'] / 100000.0, 0.2, delta=0.01)
+        self.assertAlmostEqual(counts['c'] / 100000.0, 0.7, delta=0.01)
+
+    def test_zero_weights_sample_uniformly(self):
+        table = AliasTable('abcd', [0, 0, 0, 0])
+        for p in table_probabilities(table):
+            self.assertAlmostEqual(p, 0.25)
+
+    def test_no_items(self):
+        self.assertRaises(ValueError, AliasTable, [], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
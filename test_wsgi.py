@@ -0,0 +1,185 @@
+"""test_wsgi.py - Tests for serving the API from a plain WSGI process."""
+
+import json
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+from io import BytesIO
+
+import sqlite_ndb
+
+# wsgi creates its application, importing the word bank, when imported
+sqlite_ndb.configure(':memory:')
+import wsgi
+from models import StringMessage
+from utils import BadRequestError, NotFoundError
+
+API_ROOT = wsgi.API_ROOT
+
+
+class RecordingService(object):
+    """Stands in for HangmanService, recording the requests it is given."""
+
+    def __init__(self):
+        self.calls = []
+        self.error = None
+
+    def __getattr__(self, name):
+        def method(request):
+            self.calls.append((name, request))
+            if self.error is not None:
+                raise self.error
+            return StringMessage(message=name)
+        return method
+
+
+def call(app, method, path, body=None, query_string=''):
+    """Call a WSGI application, returning the status code and JSON body."""
+    if body is None:
+        data = b''
+    elif isinstance(body, dict):
+        data = json.dumps(body).encode('utf-8')
+    else:
+        data = body
+    environ = {'REQUEST_METHOD': method,
+               'PATH_INFO': path,
+               'QUERY_STRING': query_string,
+               'CONTENT_LENGTH': str(len(data)),
+               'wsgi.input': BytesIO(data)}
+    statuses = []
+
+    def start_response(status, headers):
+        statuses.append(status)
+
+    result = b''.join(app(environ, start_response))
+    return int(statuses[0].split()[0]), json.loads(result.decode('utf-8'))
+
+
+class RoutingTest(unittest.TestCase):
+
+    def setUp(self):
+        # skip HangmanApplication.__init__, which creates a real service
+        self.app = wsgi.HangmanApplication.__new__(wsgi.HangmanApplication)
+        self.service = RecordingService()
+        self.app.service = self.service
+
+    def call(self, method, path, body=None, query_string=''):
+        return call(self.app, method, API_ROOT + path, body, query_string)
+
+    def test_routes(self):
+        routes = [('POST', 'game', {'user_name': 'ann'}, 'new_game'),
+                  ('PUT', 'game/next_level/abc', None, 'next_level'),
+                  ('PUT', 'game/abc', {'guess': 'a'}, 'make_move'),
+                  ('GET', 'game/abc', None, 'get_game'),
+                  ('GET', 'game/history/abc', None, 'get_game_history'),
+                  ('DELETE', 'game/cancel/abc', None, 'cancel_game'),
+                  ('GET', 'games/user/ann', None, 'get_user_games'),
+                  ('GET', 'games/completed/user/ann', None,
+                   'get_user_games_completed'),
+                  ('GET', 'scores/high_scores', None, 'get_high_scores'),
+                  ('GET', 'user/rankings', None, 'get_user_rankings')]
+        for method, path, body, name in routes:
+            status, result = self.call(method, path, body)
+            self.assertEqual((status, result['message']), (200, name))
+
+    def test_path_query_and_body_merged(self):
+        self.call('PUT', 'game/abc', {'guess': 'a'})
+        name, request = self.service.calls[-1]
+        self.assertEqual(request.urlsafe_game_key, 'abc')
+        self.assertEqual(request.guess, 'a')
+
+        self.call('GET', 'games/user/ann', query_string='email=a%40b.c')
+        name, request = self.service.calls[-1]
+        self.assertEqual(request.user_name, 'ann')
+        self.assertEqual(request.email, 'a@b.c')
+
+        self.call('POST', 'game', {'user_name': 'ann'})
+        name, request = self.service.calls[-1]
+        self.assertEqual(request.failed_attempts_allowed, 6)
+
+    def test_integer_parameter(self):
+        self.call('GET', 'scores/high_scores',
+                  query_string='number_of_results=3')
+        name, request = self.service.calls[-1]
+        self.assertEqual(request.number_of_results, 3)
+
+        status, result = self.call('GET', 'scores/high_scores',
+                                   query_string='number_of_results=x')
+        self.assertEqual(status, 400)
+
+    def test_bad_body(self):
+        status, result = self.call('PUT', 'game/abc', {})
+        self.assertEqual(status, 400)
+        self.assertIn('guess', result['error']['message'])
+
+        status, result = self.call('POST', 'game', b'{not json')
+        self.assertEqual(status, 400)
+        self.assertEqual(self.service.calls, [])
+
+    def test_unknown_path(self):
+        self.assertEqual(self.call('GET', 'nothing')[0], 404)
+        self.assertEqual(self.call('POST', 'game/abc')[0], 404)
+        self.assertEqual(call(self.app, 'GET', '/game')[0], 404)
+
+    def test_service_errors(self):
+        errors = [(BadRequestError('bad'), 400),
+                  (NotFoundError('missing'), 404),
+                  (KeyError('broken'), 500)]
+        for error, code in errors:
+            self.service.error = error
+            logging.disable(logging.ERROR)
+            try:
+                status, result = self.call('GET', 'game/abc')
+            finally:
+                logging.disable(logging.NOTSET)
+            self.assertEqual(status, code)
+            self.assertEqual(result['error']['code'], code)
+
+
+class ApplicationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        sqlite_ndb.configure(os.path.join(self.directory, 'test.db'))
+        self.app = wsgi.HangmanApplication()
+
+    def tearDown(self):
+        sqlite_ndb.get_pool().close()
+        shutil.rmtree(self.directory)
+
+    def call(self, method, path, body=None):
+        return call(self.app, method, API_ROOT + path, body)
+
+    def test_play_and_cancel_game(self):
+        status, game = self.call('POST', 'game', {'user_name': 'ann'})
+        self.assertEqual(status, 200)
+        self.assertEqual(game['attempts_remaining'], 6)
+        path = 'game/' + game['urlsafe_key']
+
+        status, game = self.call('PUT', path, {'guess': 'a'})
+        self.assertEqual(status, 200)
+        self.assertEqual(game['guesses'], ['a'])
+        status, result = self.call('PUT', path, {'guess': 'a'})
+        self.assertEqual(status, 400)
+
+        status, result = self.call('DELETE',
+                                   'game/cancel/' + game['urlsafe_key'])
+        self.assertEqual((status, result['message']), (200, 'Game deleted.'))
+        for method, game_path, body in [
+                ('GET', path, None),
+                ('PUT', path, {'guess': 'a'}),
+                ('PUT', 'game/next_level/' + game['urlsafe_key'], None),
+                ('DELETE', 'game/cancel/' + game['urlsafe_key'], None)]:
+            status, result = self.call(method, game_path, body)
+            self.assertEqual(status, 404)
+            self.assertEqual(result['error']['message'], 'Game not found!')
+
+    def test_invalid_key(self):
+        status, result = self.call('GET', 'game/notakey')
+        self.assertEqual(status, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,27 @@
 """utils.py - File for collecting general utility functions."""
 
 import logging
-from google.appengine.ext import ndb
-import endpoints
+import random
+from storage import ndb
+
+
+class ServiceError(Exception):
+    """Base class for errors returned to API clients.
+
+    Attributes:
+        http_status: HTTP status code of the error
+    """
+    http_status = 500
+
+
+class BadRequestError(ServiceError):
+    """Raised when an API request is invalid."""
+    http_status = 400
+
+
+class NotFoundError(ServiceError):
+    """Raised when an API request refers to a missing entity."""
+    http_status = 404
 
 
 def get_by_urlsafe(urlsafe, model):
@@ -17,14 +36,15 @@ def get_by_urlsafe(urlsafe, model):
         The entity that the urlsafe Key string points to or None if no entity
         exists.
     Raises:
-        ValueError:"""
+        BadRequestError: if the key string is malformed
+        ValueError: if the entity is of the incorrect kind"""
     try:
         key = ndb.Key(urlsafe=urlsafe)
     except TypeError:
-        raise endpoints.BadRequestException('Invalid Key')
+        raise BadRequestError('Invalid Key')
     except Exception, e:
         if e.__class__.__name__ == 'ProtocolBufferDecodeError':
-            raise endpoints.BadRequestException('Invalid Key')
+            raise BadRequestError('Invalid Key')
         else:
             raise
 
@@ -34,3 +54,47 @@ def get_by_urlsafe(urlsafe, model):
     if not isinstance(entity, model):
         raise ValueError('Incorrect Kind')
     return entity
+
+
+class AliasTable(object):
+    """Table for sampling items with given weights in O(1) per draw, using
+    Vose's alias method. Building the table is O(n).
+    Args:
+        items: List of items to sample from
+        weights: List of non-negative weights, one per item
+    """
+
+    def __init__(self, items, weights):
+        n = len(items)
+        if n == 0:
+            raise ValueError('No items to sample from')
+        total = float(sum(weights))
+        if total > 0:
+            scaled = [w * n / total for w in weights]
+        else:
+            # all weights are 0, sample uniformly
+            scaled = [1.0] * n
+        self.items = list(items)
+        self.prob = [1.0] * n
+        self.alias = list(range(n))
+
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            small_index = small.pop()
+            large_index = large.pop()
+            self.prob[small_index] = scaled[small_index]
+            self.alias[small_index] = large_index
+            scaled[large_index] -= 1.0 - scaled[small_index]
+            if scaled[large_index] < 1.0:
+                small.append(large_index)
+            else:
+                large.append(large_index)
+        # anything left over is 1.0, give or take rounding errors
+
+    def sample(self):
+        """Return a randomly selected item."""
+        i = random.randrange(len(self.items))
+        if random.random() < self.prob[i]:
+            return self.items[i]
+        return self.items[self.alias[i]]
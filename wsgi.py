@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+
+"""wsgi.py - Serves the Hangman API from a plain WSGI process, without the
+App Engine runtime or Cloud Endpoints, for self-hosting and local load
+testing.
+
+Requests are routed to the HangmanService methods using the same paths as
+the Endpoints API, under /_ah/api/hangman/v1/, and games are stored with the
+SQLite backend. Only the protorpc package is needed. Run with any WSGI
+server, e.g.
+
+    gunicorn --threads 8 wsgi:application
+
+or start the built in threaded server with
+
+    python wsgi.py [port]
+"""
+import json
+import logging
+import os
+import re
+import sys
+
+try:
+    from httplib import responses
+except ImportError:
+    from http.client import responses
+
+os.environ.setdefault('HANGMAN_STORAGE', 'sqlite')
+
+from protorpc import messages, message_types, protojson
+
+from models import NewGameForm
+from service import HangmanService
+from utils import ServiceError
+
+API_ROOT = '/_ah/api/hangman/v1/'
+
+
+# Request messages combining the body and the path and query string
+# parameters, matching the ResourceContainers in api.py
+
+class GameRequest(messages.Message):
+    urlsafe_game_key = messages.StringField(1)
+
+
+class MakeMoveRequest(messages.Message):
+    guess = messages.StringField(1, required=True)
+    urlsafe_game_key = messages.StringField(2)
+
+
+class UserRequest(messages.Message):
+    user_name = messages.StringField(1)
+    email = messages.StringField(2)
+
+
+class HighScoresRequest(messages.Message):
+    number_of_results = messages.IntegerField(1)
+
+
+# (http method, path, service method name, request message class), the
+# first matching route is used
+ROUTES = [
+    ('POST', 'game', 'new_game', NewGameForm),
+    ('PUT', 'game/next_level/{urlsafe_game_key}', 'next_level',
+     GameRequest),
+    ('GET', 'game/history/{urlsafe_game_key}', 'get_game_history',
+     GameRequest),
+    ('DELETE', 'game/cancel/{urlsafe_game_key}', 'cancel_game',
+     GameRequest),
+    ('GET', 'game/{urlsafe_game_key}', 'get_game', GameRequest),
+    ('PUT', 'game/{urlsafe_game_key}', 'make_move', MakeMoveRequest),
+    ('GET', 'scores/high_scores', 'get_high_scores', HighScoresRequest),
+    ('GET', 'games/user/{user_name}', 'get_user_games', UserRequest),
+    ('GET', 'games/completed/user/{user_name}', 'get_user_games_completed',
+     UserRequest),
+    ('GET', 'user/rankings', 'get_user_rankings', None),
+]
+
+
+def _compile_route(path):
+    """Return a regex matching an Endpoints path template."""
+    pattern = re.sub(r'\{(\w+)\}', r'(?P<\1>[^/]+)', path)
+    return re.compile('^' + pattern + '$')
+
+
+_routes = [(http_method, _compile_route(path), name, message_class)
+           for http_method, path, name, message_class in ROUTES]
+
+
+def _parse_query_string(query_string):
+    try:
+        from urlparse import parse_qsl
+    except ImportError:
+        from urllib.parse import parse_qsl
+    return dict(parse_qsl(query_string))
+
+
+def _build_request(message_class, body, params):
+    """Return the request message for a service method, from the JSON
+    request body, and the path and query string parameters."""
+    if message_class is None:
+        return message_types.VoidMessage()
+    request = protojson.decode_message(message_class, body or '{}')
+    for name, value in params.items():
+        try:
+            field = message_class.field_by_name(name)
+        except KeyError:
+            continue
+        if isinstance(field, messages.IntegerField):
+            value = int(value)
+        setattr(request, name, value)
+    request.check_initialized()
+    return request
+
+
+def _response(start_response, status, body):
+    body = body.encode('utf-8') if not isinstance(body, bytes) else body
+    start_response(status, [('Content-Type', 'application/json'),
+                            ('Content-Length', str(len(body)))])
+    return [body]
+
+
+def _error(start_response, status, message):
+    code = int(status.split()[0])
+    return _response(start_response, status, json.dumps(
+        {'error': {'code': code, 'message': message}}))
+
+
+class HangmanApplication(object):
+    """WSGI application dispatching requests to HangmanService methods."""
+
+    def __init__(self):
+        # a single instance, the service methods keep no per request state
+        self.service = HangmanService()
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if not path.startswith(API_ROOT):
+            return _error(start_response, '404 Not Found', 'Not Found')
+        path = path[len(API_ROOT):]
+        http_method = environ['REQUEST_METHOD']
+
+        for route_method, pattern, name, message_class in _routes:
+            match = pattern.match(path)
+            if match and route_method == http_method:
+                break
+        else:
+            return _error(start_response, '404 Not Found', 'Not Found')
+
+        params = _parse_query_string(environ.get('QUERY_STRING', ''))
+        params.update(match.groupdict())
+        try:
+            length = int(environ.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            length = 0
+        body = environ['wsgi.input'].read(length).decode('utf-8') \
+            if length else ''
+
+        try:
+            request = _build_request(message_class, body, params)
+        except (ValueError, messages.Error) as e:
+            return _error(start_response, '400 Bad Request', str(e))
+
+        try:
+            response = protojson.encode_message(
+                getattr(self.service, name)(request))
+        except ServiceError as e:
+            status = '{0} {1}'.format(e.http_status,
+                                      responses.get(e.http_status, ''))
+            return _error(start_response, status, str(e))
+        except Exception:
+            logging.exception('Error calling %s', name)
+            return _error(start_response, '500 Internal Server Error',
+                          'Internal Server Error')
+
+        return _response(start_response, '200 OK', response)
+
+
+application = HangmanApplication()
+
+
+if __name__ == '__main__':
+    from wsgiref.simple_server import make_server, WSGIServer
+    try:
+        from SocketServer import ThreadingMixIn
+    except ImportError:
+        from socketserver import ThreadingMixIn
+
+    class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+        daemon_threads = True
+
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8080
+    server = make_server('', port, application,
+                         server_class=ThreadingWSGIServer)
+    logging.info('Serving the Hangman API on port %d', port)
+    server.serve_forever()